@@ -11,39 +11,157 @@ Released under the Apache 2.0 license as described in the file LICENSE.
 import os
 import logging
 import functools
-from types import SimpleNamespace
-import textwrap
 
-from cookiecutter.main import cookiecutter
-from jinja2 import Environment, FileSystemLoader
 import click
 
 from logformat import CustomFormatter, print_dicts, EchoHTML as html
 
-from source import SourceHandler
-from server import ServerHandler, Site
+# UTILS
 
-from storage import SITE_TEMPLATE, SITES_FILE, SITES_ROOT, SNIPPETS_TEMPLATE
+@functools.lru_cache(maxsize=1)
+def _get_source():
+    """ Import the source handlers only when a command needs them """
+    from source import SourceHandler
+    return SourceHandler
 
-# UTILS
 
-def common_params(f):
-    """ Decorator to apply common parameters to all commands """
-    @click.option("-v", "--verbose", count=True, help="Verbosity level [DEFAULT: ERROR]")
-    @functools.wraps(f)
-    def wrapper(*args, verbose, **kwargs):
-        # Setup logging for verbosity level
-        level = 40 - (verbose * 10)
-        CustomFormatter.set_level(level)
-        return f(*args, verbose, **kwargs)
-    return wrapper
+@functools.lru_cache(maxsize=1)
+def _get_server():
+    """ Import the server handlers only when a command needs them """
+    from server import ServerHandler
+    return ServerHandler
+
+
+@functools.lru_cache(maxsize=1)
+def _get_site():
+    """ Import the sites only when a command needs them """
+    from server import Site
+    return Site
+
+
+@functools.lru_cache(maxsize=1)
+def _snippet_env():
+    """ The jinja environment for python snippet templates, built on first use """
+    from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader
+    from storage import JINJA_CACHE, SNIPPETS_TEMPLATE
+    # Compiled templates persist between CLI runs, which are too short-lived to
+    # benefit from the in-memory cache alone
+    JINJA_CACHE.mkdir(parents=True, exist_ok=True)
+    return Environment(
+        loader=FileSystemLoader(SNIPPETS_TEMPLATE),
+        autoescape=False,
+        auto_reload=False,
+        bytecode_cache=FileSystemBytecodeCache(str(JINJA_CACHE)),
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def _short_desc(docs):
+    """ The first non-blank line of a handler docstring, for list tables """
+    docs = docs or ""
+    start = 0
+    while start < len(docs):
+        end = docs.find("\n", start)
+        if end == -1:
+            end = len(docs)
+        line = docs[start:end].strip()
+        if line:
+            return line
+        start = end + 1
+    return ""
+
+
+def _set_verbosity(ctx, param, verbose):
+    """ Lower the log level when `-v` is given; without it the current level stands """
+    if verbose:
+        CustomFormatter.set_level(logging.ERROR - (verbose * 10))
+
+
+_VERBOSE_OPTION = click.Option(
+    ["-v", "--verbose"],
+    count=True,
+    expose_value=False,
+    callback=_set_verbosity,
+    help="Verbosity level [DEFAULT: ERROR]",
+)
+""" Shared by every command; options hold no per-invocation state """
+
+
+def _modified_markup(path):
+    """ When a path last changed as EchoHTML markup, or NEVER if it doesn't exist """
+    modified = path.times.modified  # A single stat pass; None when missing
+    if modified is None:
+        return "<fg c=red>NEVER</fg>"
+    return f"<fg c=teal>{modified.strftime('%Y-%m-%d %H:%M:%S')}</fg>"
+
+
+def _join_names(handlers):
+    """ Comma-separated NAMEs of linked sites or servers, for list tables """
+    return ", ".join(handler.NAME for handler in handlers)
+
+
+class _VerboseMixin:
+    """ Gives a click command the shared `-v` option """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.params.append(_VERBOSE_OPTION)
+
+
+class ExoCommand(_VerboseMixin, click.Command):
+    """ A leaf command of the `exo` CLI """
+
+
+class ExoGroup(_VerboseMixin, click.Group):
+    """ A command group whose subcommands and subgroups all take `-v` """
+
+    command_class = ExoCommand
+    group_class = type  # Subgroups are ExoGroups too
+
+
+class CliState:
+    """ State a command group hands down to its subcommands through `ctx.obj` """
+
+    __slots__ = ("name", "handler", "_instance")
+
+    def __init__(self, name, handler):
+        self.name = name
+        self.handler = handler
+        """ The source, site, or server class being managed """
+        self._instance = None
+
+    @property
+    def instance(self):
+        """ The handler, instantiated on first use so that help never constructs it """
+        if self._instance is None:
+            self._instance = self.handler()
+        return self._instance
+
+
+def _list_command(name, registry, extra_column, help):
+    """
+    Make a top-level command that tabulates `registry().list`.
+
+    Sources, sites, and servers all list a name and description and differ only
+    in one extra (key, mapping) column, so the commands are generated here.
+    """
+    key, column = extra_column
+    mapper = {
+        "name": {"name": "Name"},
+        "docs": {"name": "Description", "transform": _short_desc},
+        key: column,
+    }
+
+    @cli.command(name=name, help=help)
+    def list_command():
+        print_dicts(registry().list, mapper=mapper)
+    return list_command
 
 
 # GENERAL-PURPOSE
 
-@click.group(context_settings=dict(help_option_names=["-h", "--help"]))
-@common_params
-def cli(verbose):
+@click.group(cls=ExoGroup, context_settings=dict(help_option_names=["-h", "--help"]))
+def cli():
     """
     Manage the Exocortex.
 
@@ -57,8 +175,7 @@ def cli(verbose):
 # GRAPH
 
 @cli.group()
-@common_params
-def graph(verbose):
+def graph():
     """
     Manage the graph-level content.
 
@@ -70,8 +187,7 @@ def graph(verbose):
 
 
 @graph.command(name="list")
-@common_params
-def list_content(verbose):
+def list_content():
     """
     List all known content.
 
@@ -81,8 +197,7 @@ def list_content(verbose):
 
 
 @graph.command()
-@common_params
-def build(verbose):
+def build():
     """ Build the content graph. """
     raise NotImplementedError("Implement this")
 
@@ -91,9 +206,8 @@ def build(verbose):
 
 @cli.group(invoke_without_command=True)
 @click.pass_context
-@common_params
 @click.argument("source")
-def source(ctx, verbose, source):
+def source(ctx, source):
     """
     Manage external content source SOURCE.
 
@@ -101,38 +215,27 @@ def source(ctx, verbose, source):
     modalities into a single interface. These commands are designed to import and
     manage various sources outside of `content/`.
     """
-    ctx.obj = SimpleNamespace()
-    ctx.obj.name = source
-    ctx.obj.source = SourceHandler[source]
+    ctx.obj = CliState(source, _get_source()[source])
 
     if ctx.invoked_subcommand is None:
-        ctx.invoke(view_source_info, verbose=verbose)
+        ctx.invoke(view_source_info)
 
 
-@cli.command(name="sources")
-@common_params
-def list_sources(verbose):
-    """
-    List all known sources.
-    """
-    print_dicts(
-        SourceHandler.list,
-        mapper={
-            "name": {"name": "Name"},
-            "docs": {"name": "Description", "transform": lambda s: s.split("\n")[1].strip()},
-            "last-imported": {"name": "Imported"},
-        },
-    )
+list_sources = _list_command(
+    "sources",
+    _get_source,
+    ("last-imported", {"name": "Imported"}),
+    help="List all known sources.",
+)
 
 
 @source.command(name="view")
 @click.pass_context
-@common_params
-def view_source_info(ctx, verbose):
+def view_source_info(ctx):
     """
     Get a detailed overview of the source.
     """
-    scls = ctx.obj.source
+    scls = ctx.obj.handler
     click.secho(f"Source: {scls.name}", fg="white", bold=True)
     click.secho(f"Class: {scls.__name__}", fg="blue")
     click.secho("Last Import: ", fg="blue", nl=False)
@@ -141,12 +244,11 @@ def view_source_info(ctx, verbose):
         fg=("red" if scls.info["last-imported"] == "NEVER" else "blue")
     )
     click.echo()
-    click.secho(textwrap.dedent(scls.info["docs"]).strip(), italic=True)
+    click.secho(scls.display_docs, italic=True)
     click.echo()
 
 
 @source.command(name="import")
-@common_params
 @click.option("-d", "--directory",
               default=None,
               type=click.Path(),
@@ -155,11 +257,11 @@ def view_source_info(ctx, verbose):
               default=True,
               help="Run the import code but don't actually write any files or data")
 @click.pass_context
-def import_from_source(ctx, verbose, directory, dry_run):
+def import_from_source(ctx, directory, dry_run):
     """
     Import from the source to the content directory.
     """
-    src = ctx.obj.source()
+    src = ctx.obj.handler()
     src.import_to_dir(directory, dry_run)
 
 
@@ -167,9 +269,8 @@ def import_from_source(ctx, verbose, directory, dry_run):
 
 @cli.group(invoke_without_command=True)
 @click.pass_context
-@common_params
 @click.argument("site")
-def site(ctx, verbose, site):
+def site(ctx, site):
     """
     Manage the SITE views.
 
@@ -179,37 +280,24 @@ def site(ctx, verbose, site):
     the sites themselves, creating new sites, archiving old ones, or performing certain
     migrations happens through these commands.
     """
-    ctx.obj = SimpleNamespace()
-    ctx.obj.name = site
-    ctx.obj.site = Site[site]
-    if ctx.obj.site:
-        ctx.obj.nodejs = ctx.obj.site.make_nodejs()
+    ctx.obj = CliState(site, _get_site()[site])
 
     if ctx.invoked_subcommand is None:
-        if ctx.obj.site:
-            info = ctx.obj.site.info
+        if ctx.obj.handler:
+            info = ctx.obj.handler.info
             html.echo(
                 f"<fg c=white>Site: <b>{info['name']}</b><br />"
                 f"<i><fg c=blue>{info['docs']}</fg></i><br />"
                 f"Source Location:\t<fg c=teal>{info['source_dir']}<br /></fg>"
                 f"Servers Linked:\t\t<fg c=teal>{', '.join([s.name for s in info['servers']])}<br /></fg>"
                 "Source Updated:\t\t" +
-                ("<fg c=red>NEVER</fg>"
-                    if not info['source_dir'].exists()
-                    else f"<fg c=teal>{info['source_dir'].times.modified.strftime('%Y-%m-%d %H:%M:%S')}</fg>"
-                ) +
+                _modified_markup(info['source_dir']) +
                 "\n"
                 "Last package install:\t" +
-                ("<fg c=red>NEVER</fg>"
-                    if not info['node_dir'].exists()
-                    else f"<fg c=teal>{info['node_dir'].times.modified.strftime('%Y-%m-%d %H:%M:%S')}</fg>"
-                ) +
+                _modified_markup(info['node_dir']) +
                 "\n"
                 "Last dist build:\t" +
-                ("<fg c=red>NEVER</fg>"
-                    if not info['dist_dir'].exists()
-                    else f"<fg c=teal>{info['dist_dir'].times.modified.strftime('%Y-%m-%d %H:%M:%S')}</fg>"
-                ) +
+                _modified_markup(info['dist_dir']) +
                 "\n"
                 "Site Version:\t\t" +
                 ("<fg c=red>package.json NOT FOUND</fg>"
@@ -222,27 +310,17 @@ def site(ctx, verbose, site):
             click.echo(f"No site named {site}, create it with `exo site {site} make`")
 
 
-@cli.command(name="sites")
-@common_params
-def list_sites(verbose):
-    """ List all hostable sites. """
-    print_dicts(
-        Site.list,
-        mapper={
-            "name": {"name": "Name"},
-            "docs": {"name": "Description", "transform": lambda s: s.split("\n")[1].strip()},
-            "servers": {
-                "name": "Servers",
-                "transform": lambda slist: ", ".join([s.NAME for s in slist]),
-            },
-        },
-    )
+list_sites = _list_command(
+    "sites",
+    _get_site,
+    ("servers", {"name": "Servers", "transform": _join_names}),
+    help="List all hostable sites.",
+)
 
 
 @site.command(name="make")
 @click.pass_context
-@common_params
-def make_site(ctx, verbose):
+def make_site(ctx):
     """
     Create a new site.
 
@@ -250,6 +328,9 @@ def make_site(ctx, verbose):
     TODO: Allow the user to control auto-adding to servers.
     """
 
+    from cookiecutter.main import cookiecutter
+    from storage import SITE_TEMPLATE, SITES_FILE, SITES_ROOT
+
     click.echo(f"Creating site '{ctx.obj.name}'")
     
     os.chdir(SITES_ROOT)
@@ -262,11 +343,7 @@ def make_site(ctx, verbose):
         overwrite_if_exists=True,  # Remove when done testing
     )
     
-    env = Environment(
-        loader=FileSystemLoader(SNIPPETS_TEMPLATE),
-        autoescape=False,
-    )
-    template = env.get_template("new-site-stub.py")
+    template = _snippet_env().get_template("new-site-stub.py")
     classname = f"{ctx.obj.name.capitalize()}Site"
     code = template.render(
         name=ctx.obj.name,
@@ -276,37 +353,35 @@ def make_site(ctx, verbose):
     with SITES_FILE.open("a") as f:
         f.write("\n\n" + code)
 
-    with (SITES_FILE.parent / "development.py").open("r+") as f:
+    # Everything up to the sites import stays in place; only the tail is rewritten
+    with (SITES_FILE.parent / "development.py").open("rb+") as f:
         src = f.read()
-        lines = src.split("\n")
-        import_index = lines.index("from sites import (")
-        lines.insert(import_index + 1, f"    {classname},")
-        lines.append(f"DevelopmentServer.site({ classname })")
-
-        src = "\n".join(lines)
-        f.seek(0)
-        f.write(src)
+        marker = b"\nfrom .sites import (\n"
+        insert_at = src.index(marker) + len(marker)
+        f.seek(insert_at)
+        f.write(
+            f"    {classname},\n".encode()
+            + src[insert_at:]
+            + f"\nDevelopmentServer.site({ classname })".encode()
+        )
 
 
 @site.command(name="install")
 @click.pass_context
-@common_params
-def install_site_packages(ctx, verbose):
+def install_site_packages(ctx):
     """ Install required node packages. """
-    ctx.obj.nodejs.install_packages()
+    ctx.obj.handler.make_nodejs().install_packages()
 
 
 @site.command(name="build")
 @click.pass_context
-@common_params
-def build_site(ctx, verbose):
+def build_site(ctx):
     """ Build the site bundles. """
-    ctx.obj.nodejs.build_dist()
+    ctx.obj.handler.make_nodejs().build_dist()
 
 
 @site.command(name="delete")
-@common_params
-def delete_site(verbose):
+def delete_site():
     """ Delete a site. """
     raise NotImplementedError("Implement this")
 
@@ -315,9 +390,8 @@ def delete_site(verbose):
 
 @cli.group()
 @click.pass_context
-@common_params
 @click.argument("server")
-def server(ctx, verbose, server):
+def server(ctx, server):
     """
     Manage the server hosting and devops cycle.
 
@@ -329,46 +403,37 @@ def server(ctx, verbose, server):
     hosting solution is desired. Additionally, this group has status and networking
     tools for debugging.
     """
-    ctx.obj = SimpleNamespace()
-    ctx.obj.name = server
-    ctx.obj.server = ServerHandler[server]()
-
-
-@cli.command(name="servers")
-@common_params
-def list_servers(verbose):
-    """ List all hostable servers. """
-    print_dicts(
-        ServerHandler.list,
-        mapper={
-            "name": {"name": "Name"},
-            "docs": {"name": "Description", "transform": lambda s: s.split("\n")[1].strip()},
-            "sites": {
-                "name": "Sites",
-                "transform": lambda slist: ", ".join([s.NAME for s in slist]),
-            },
-        },
-    )
+    ctx.obj = CliState(server, _get_server()[server])
+
+
+list_servers = _list_command(
+    "servers",
+    _get_server,
+    ("sites", {"name": "Sites", "transform": _join_names}),
+    help="List all hostable servers.",
+)
 
 
 @server.command(name="host")
 @click.pass_context
-@common_params
 @click.option("-p", "--port", default=5000, help="Port to run the server on")
-def host_server(ctx, verbose, port):
+@click.option("-w", "--workers",
+              default=os.cpu_count() or 1,
+              help="Processes to parse the content with [DEFAULT: one per core]")
+def host_server(ctx, port, workers):
     """
     Host the named server.
 
     This command will create a new server and host it.
     """
-    ctx.obj.server.run(port=port)
+    # Content is parsed before the app starts serving, so no request threads exist yet
+    ctx.obj.handler(parse_workers=workers).run(port=port)
 
 
 # CODE
 
 @cli.group()
-@common_params
-def code(verbose):
+def code():
     """
     Track and manage the codebase development.
 
@@ -381,8 +446,7 @@ def code(verbose):
 
 
 @code.command()
-@common_params
-def tasks(verbose):
+def tasks():
     """
     Show all tasks found in the codebase.
 
@@ -407,8 +471,7 @@ def tasks(verbose):
 
 
 @code.command()
-@common_params
-def phase(verbose):
+def phase():
     """
     View or set the current phase.
 
@@ -424,8 +487,7 @@ def phase(verbose):
 
 
 @code.command()
-@common_params
-def goal(verbose):
+def goal():
     """
     List or manage broad goals.
 
@@ -450,7 +512,6 @@ def goal(verbose):
     """
     raise NotImplementedError("Goal management command")
 
-trilium = SourceHandler["trilium"]()
 
 if __name__ == "__main__":
     CustomFormatter.setup_logging()
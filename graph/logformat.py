@@ -9,9 +9,13 @@ Released under the Apache 2.0 license as described in the file LICENSE.
 """
 
 import os
-import inspect
+import sys
 import pprint
+import linecache
+import signal
+import shutil
 import logging
+import functools
 from pathlib import Path
 from html.parser import HTMLParser
 from collections import namedtuple
@@ -23,6 +27,9 @@ import click
 from libtool.utils.formatting import ANSIFormatter
 
 
+_ANSI_RESET = "\x1b[0m"
+
+
 class EchoHTML(HTMLParser):
     """
     Write log messages in an HTML-like format and print with click echo.
@@ -40,6 +47,23 @@ class EchoHTML(HTMLParser):
 
     EchoAtom = namedtuple("EchoAtom", ["text", "style"])
 
+    EchoStyle = namedtuple(
+        "EchoStyle",
+        ["bold", "italic", "underline", "overline", "strikethrough", "blink", "fg", "bg"],
+        defaults=[None] * 8,
+    )
+    """ Immutable, so atoms share the current style instead of copying it """
+
+    TAG_STYLES = {
+        "b": "bold",
+        "i": "italic",
+        "u": "underline",
+        "over": "overline",
+        "strike": "strikethrough",
+        "blink": "blink",
+    }
+    """ Tags that switch on a single EchoStyle attribute """
+
     COLORS = {
         "magenta": (255, 0, 255),
         "cyan": (0, 255, 255),
@@ -66,87 +90,66 @@ class EchoHTML(HTMLParser):
     def __init__(self):
         super().__init__()
         self.echo_atoms: List[EchoHTML.EchoAtom] = []
-        self.current_style = {}
-        self.current_text = ""
-
-        self.fg_stack = []
-        self.bg_stack = []
+        self.current_style = EchoHTML.EchoStyle()
+        self.text_buffer: List[str] = []
+        """ Text waiting to become the next atom, joined once when it is emitted """
+        self.style_stack: List[EchoHTML.EchoStyle] = []
+        """ The style in effect before each open tag, restored when it closes """
     
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def style_prefix(style):
+        """ The escape codes that open a style, built by click once per distinct style """
+        kwargs = {key: value for key, value in style._asdict().items() if value is not None}
+        return click.style("", reset=False, **kwargs)
+
     def do_echo(self):
         """ Echo all accumulated atoms """
-        for atom in self.echo_atoms:
-            click.secho(atom.text, nl=False, reset=True, **atom.style)
-        click.secho("", reset=True)
+        # Every atom resets its own style, so the message goes out in one write
+        click.echo("".join(
+            f"{self.style_prefix(atom.style)}{atom.text}{_ANSI_RESET}"
+            for atom in self.echo_atoms
+        ))
     
     def handle_data(self, data):
         """
         Handle data.
         """
-        self.current_text += data
-        self.echo_atoms.append(EchoHTML.EchoAtom(self.current_text, self.current_style.copy()))
-        self.current_text = ""
+        self.text_buffer.append(data)
+        self.echo_atoms.append(
+            EchoHTML.EchoAtom("".join(self.text_buffer), self.current_style)
+        )
+        self.text_buffer.clear()
     
     def handle_starttag(self, tag, attrs):
         """
         Handle start tags.
         """
         if tag == "br":
-            self.current_text += "\n"
-        if tag == "b":
-            self.current_style["bold"] = True
-        if tag == "i":
-            self.current_style["italic"] = True
-        if tag == "u":
-            self.current_style["underline"] = True
-        if tag == "over":
-            self.current_style["overline"] = True
-        if tag == "strike":
-            self.current_style["strikethrough"] = True
-        if tag == "blink":
-            self.current_style["blink"] = True
-        if tag == "fg":
-            color_name = attrs[0][1]
-            color = self.COLORS.get(color_name, color_name)
-            if "fg" in self.current_style:
-                self.fg_stack.append(self.current_style["fg"])
-            self.current_style["fg"] = color
-        if tag == "bg":
+            self.text_buffer.append("\n")
+        elif tag in self.TAG_STYLES:
+            self.push_style(**{self.TAG_STYLES[tag]: True})
+        elif tag in ("fg", "bg"):
             color_name = attrs[0][1]
-            color = self.COLORS.get(color_name, color_name)
-            if "bg" in self.current_style:
-                self.bg_stack.append(self.current_style["bg"])
-            self.current_style["bg"] = color
+            self.push_style(**{tag: self.COLORS.get(color_name, color_name)})
 
     def handle_endtag(self, tag):
         """
         Handle end tags.
         """
-        if tag == "b":
-            self.current_style["bold"] = False
-        if tag == "i":
-            self.current_style["italic"] = False
-        if tag == "u":
-            self.current_style["underline"] = False
-        if tag == "over":
-            self.current_style["overline"] = False
-        if tag == "strike":
-            self.current_style["strikethrough"] = False
-        if tag == "blink":
-            self.current_style["blink"] = False
-        if tag == "fg":
-            if self.fg_stack:
-                color_name = self.fg_stack.pop()
-                color = self.COLORS.get(color_name, color_name)
-                self.current_style["fg"] = color
-            else:
-                del self.current_style["fg"]
-        if tag == "bg":
-            if self.bg_stack:
-                color_name = self.bg_stack.pop()
-                color = self.COLORS.get(color_name, color_name)
-                self.current_style["bg"] = color
-            else:
-                del self.current_style["bg"]
+        if (tag in self.TAG_STYLES or tag in ("fg", "bg")) and self.style_stack:
+            self.current_style = self.style_stack.pop()
+
+    def push_style(self, **changes):
+        """ Snapshot the current style and apply `changes` until the matching end tag """
+        self.style_stack.append(self.current_style)
+        self.current_style = self.current_style._replace(**changes)
+
+
+def _ansi_wrap(styles):
+    """ Split `ANSIFormatter.ansify_string` into the codes it puts before and after text """
+    prefix, _, suffix = ANSIFormatter.ansify_string(styles, "\0").partition("\0")
+    return prefix, suffix
 
 
 class CustomFormatter(logging.Formatter):
@@ -162,40 +165,78 @@ class CustomFormatter(logging.Formatter):
         "CRITICAL": ["RED", "BOLD", ],
     }
 
+    WRAPS = dict(zip(STYLES, map(_ansi_wrap, STYLES.values())))
+    """ (prefix, suffix) escape codes per level, built once from STYLES """
+
+    TRACE_WRAPS = {
+        "head": _ansi_wrap(["BLUE", "BOLD"]),
+        "loc": _ansi_wrap(["BLUE", ]),
+        "dump": _ansi_wrap(["WHITE"]),
+    }
+    """ (prefix, suffix) escape codes for each part of a `trace` """
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         logging.trace = self.trace
-        self.printer = pprint.PrettyPrinter(indent=2, width=self.width)
+        self._use_color = self.wants_color(sys.stderr)
+        self._trace_color = self.wants_color(sys.stdout)
+
+    @staticmethod
+    def wants_color(stream):
+        """ Style only terminal output, and never when NO_COLOR is set """
+        return stream.isatty() and "NO_COLOR" not in os.environ
+
+    _ROOT_LOGGER = logging.getLogger()
+    """ Bound once; every method here configures or queries the root logger """
+
+    _current_level = None
+    """ The level last applied by `set_level`, to skip redundant updates """
 
     @staticmethod
     def setup_logging():
-        logger = logging.getLogger()
+        logger = CustomFormatter._ROOT_LOGGER
         logger.setLevel(logging.ERROR)
 
         ch = logging.StreamHandler()
         ch.setLevel(logging.ERROR)
         ch.setFormatter(CustomFormatter())
         logger.addHandler(ch)
+        CustomFormatter._current_level = logging.ERROR
+
+        if hasattr(signal, "SIGWINCH"):  # Not available on Windows
+            signal.signal(
+                signal.SIGWINCH,
+                lambda *_: CustomFormatter.get_width.cache_clear(),
+            )
 
     @staticmethod
     def set_level(level):
-        logger = logging.getLogger()
+        if level == CustomFormatter._current_level:
+            return
+        logger = CustomFormatter._ROOT_LOGGER
         logger.setLevel(level)
         for handler in logger.handlers:
             handler.setLevel(level)
+        CustomFormatter._current_level = level
+
+    @staticmethod
+    def is_enabled_for(level):
+        """ Check the level before building expensive log messages """
+        return CustomFormatter._ROOT_LOGGER.isEnabledFor(level)
 
     @property
     def level(self):
-        logger = logging.getLogger()
-        return logger.level
+        return self._ROOT_LOGGER.level
 
     @property
     def width(self):
         return self.get_width()
 
     @staticmethod
+    @functools.lru_cache(maxsize=1)
     def get_width():
-        return os.get_terminal_size().columns
+        """ Terminal width; cached until a resize (see `setup_logging`) """
+        return shutil.get_terminal_size().columns
 
     def format_file(self, fpath):
         path = Path(fpath)
@@ -203,38 +244,48 @@ class CustomFormatter(logging.Formatter):
 
     def trace(self, obj, *args, **kwargs):
         """ Pretty-print smart tracing utility """
-        if self.level > 5:
+        if not self.is_enabled_for(5):
             return
 
-        frame = inspect.getouterframes(inspect.currentframe(), 2)[1]
-        cline = frame.code_context[-1]  # Get the string of the trace call line
+        frame = sys._getframe(1)  # Only the caller, not the whole stack
+        filename, lineno = frame.f_code.co_filename, frame.f_lineno
+        cline = linecache.getline(filename, lineno)  # Get the string of the trace call line
         pre, *desc = cline.split("#")  # Find any description in a comment after
         desc = desc or None
         argstring = pre[pre.find("(")+1:pre.rfind(")")]  # Extract the outermost parentheses
         otype = type(obj)
 
         head = f"\u2192 {argstring} of type '{otype.__name__}'"
-        loc = f"{self.format_file(frame.filename)}, line {frame.lineno}"
-        head = head.ljust(self.width - len(loc) - 2)
+        loc = f"{self.format_file(filename)}, line {lineno}"
+        dump = pprint.pformat(obj, indent=2, width=self.width)  # Current width, not init-time
 
-        dump = self.printer.pformat(obj)
-        full = ""\
-            + ANSIFormatter.ansify_string(["BLUE", "BOLD"], head)\
-            + ANSIFormatter.ansify_string(["BLUE", ], loc) + "  \n"\
-            + ANSIFormatter.ansify_string(["WHITE"], dump)\
-            + "\n"
+        if not self._trace_color:
+            print(f"{head}  {loc}\n{dump}\n")
+            return
 
-        print(full)
+        wraps = self.TRACE_WRAPS
+        (head_on, head_off), (loc_on, loc_off) = wraps["head"], wraps["loc"]
+        dump_on, dump_off = wraps["dump"]
+        pad = max(0, self.width - len(loc) - 2)
+        print(
+            f"{head_on}{head:<{pad}}{head_off}{loc_on}{loc}{loc_off}  \n"
+            f"{dump_on}{dump}{dump_off}\n"
+        )
 
     def format(self, record):
         if record.levelname == "INFO":
             full = record.msg
+        elif not self._use_color:
+            # Right-aligning to the terminal width means nothing in a file or pipe
+            return f"{record.msg}  {self.format_file(record.pathname)}, line {record.lineno}"
         else:
             right = f"{self.format_file(record.pathname)}, line {record.lineno}  "
-            message = record.msg
-            rcols = " " * (self.width - len(message) - len(right))
-            full = f"{message}{rcols}{right}"
-        return ANSIFormatter.ansify_string(self.STYLES[record.levelname], full)
+            pad = max(0, self.width - len(right))
+            full = f"{record.msg:<{pad}}{right}"
+        if not self._use_color:
+            return full
+        prefix, suffix = self.WRAPS[record.levelname]
+        return f"{prefix}{full}{suffix}"
 
 
 # BUG Click >8.0 is needed for the RGB colors but cookiecutter is incompatible, pls fix
@@ -248,36 +299,39 @@ def print_columns(
         even_color=(189, 211, 219),
         odd_color=(145, 188, 204),
         ):
-    maxlens = [max([len(s) for s in col]) for col in columns]
+    maxlens = [max(map(len, col)) for col in columns]
     width = CustomFormatter.get_width()
     if vbars:
         width -= len(columns)
     spare = width - sum(maxlens)
     margin = int(spare / len(columns))
-
-    for i in range(len(columns[0])):
-        for j in range(len(columns)):
-            click.echo(
-                click.style(
-                    columns[j][i].ljust(maxlens[j] + margin),
-                    underline=(i < header_rows),
-                    bold=(i < header_rows) or (bold_first_col and j == 0),
-                    fg=header_color if i < header_rows else
-                      (even_color if i % 2 == 0 else odd_color),
-                ),
-                nl=False,
-            )
-            if vbars:
-                click.echo(
-                    click.style(
-                        "|",
-                        underline=(i < header_rows),
-                        fg=header_color,
-                    ),
-                    nl=False,
-                )
-        click.echo()
-    click.echo()
+    widths = [maxlen + margin for maxlen in maxlens]
+
+    # There are only three row styles (header, even, odd), so build their escape
+    # sequences once, per column, rather than calling click.style for every cell
+    def row_style(underline, color, first_bold, rest_bold):
+        prefixes = [
+            click.style("", underline=underline, bold=bold, fg=color, reset=False)
+            for bold in [first_bold, *[rest_bold] * (len(columns) - 1)]
+        ]
+        vbar = click.style("|", underline=underline, fg=header_color) if vbars else ""
+        return prefixes, vbar
+
+    header_style = row_style(True, header_color, True, True)
+    body_styles = [
+        row_style(False, color, bold_first_col, False) for color in (even_color, odd_color)
+    ]
+
+    # Render the whole table first so it goes out in a single write
+    lines = []
+    for i, row in enumerate(zip(*columns)):
+        prefixes, vbar = header_style if i < header_rows else body_styles[i % 2]
+        lines.append("".join(
+            f"{prefix}{cell.ljust(cell_width)}{_ANSI_RESET}{vbar}"
+            for prefix, cell, cell_width in zip(prefixes, row, widths)
+        ))
+    lines.append("")
+    click.echo("\n".join(lines))
 
 
 def print_table(table, **kwargs):
@@ -287,18 +341,31 @@ def print_table(table, **kwargs):
     print_columns(columns, **kwargs)
 
 
+def _identity(value):
+    return value
+
+
 def print_dicts(dcts, fill_missing="?", mapper={}, **kwargs):
+    dcts = list(dcts)
+    # Resolve each mapped column's (name, transform) once, not once per cell
+    resolved = {
+        key: (spec.get("name", key), spec.get("transform", _identity))
+        for key, spec in mapper.items()
+    }
+    # Allocate every column at full length in first-seen order, then fill in place;
+    # rows missing a key keep `fill_missing` in their own slot
+    keys = dict.fromkeys(
+        key for dct in dcts for key in dct if key in resolved or not mapper
+    )
     table = {}
+    columns = {}
+    for key in keys:
+        col_name, transform = resolved.get(key, (key, _identity))
+        columns[key] = (table.setdefault(col_name, [fill_missing] * len(dcts)), transform)
     for i, dct in enumerate(dcts):
-        for col_name, col_val in dct.items():
-            if col_name in mapper:
-                col_val = mapper[col_name].get("transform", lambda x: x)(col_val)
-                col_name = mapper[col_name].get("name", col_name)
-            elif mapper:
-                continue
-            if col_name not in table:
-                table[col_name] = [*[fill_missing]*i, col_val]
-            else:
-                table[col_name] += [col_val]
+        for key, value in dct.items():
+            if key in columns:
+                column, transform = columns[key]
+                column[i] = transform(value)
     if table:
-        print_table(table, **kwargs)
\ No newline at end of file
+        print_table(table, **kwargs)
@@ -8,9 +8,12 @@ Copyright (c) 2022 Ben Croisdale. All rights reserved.
 Released under the Apache 2.0 license as described in the file LICENSE.
 """
 
-from collections import namedtuple
+from collections import namedtuple, defaultdict, OrderedDict
+from functools import cached_property
+import heapq
 
-from uuid import uuid4
+import os
+from uuid import UUID
 import toml
 
 import numpy as np
@@ -21,7 +24,7 @@ from marko.block import Document
 
 from graph_tool import (
     Graph, GraphView, load_graph,
-    draw, centrality, topology, clustering,
+    draw, centrality, topology, clustering, search,
 )
 from graph_tool.draw import graph_draw
 
@@ -47,70 +50,162 @@ def iterate_document(document: Document):
     Generator that iterates depth-first top-down through a marko Document,
     doing some light decoration for consistency.
     """
-    for elem in _iterate_element_td_df(document):
-        yield elem
+    return _iterate_element_td_df(document)
+
+_UNSET = object()
+""" Marks an element the walker has never given a parent, the root included """
 
 def _iterate_element_td_df(element: Element, parent: Element = None):
-    if isinstance(element, str):
-        element = RawString(element)
-    
-    if not hasattr(element, "children"):
-        element.children = []
-    element.parent = parent
-    yield element
+    # An explicit stack rather than recursion: no generator frame per node and no
+    # recursion limit on deeply nested documents
+    stack = [(element, parent)]
+    while stack:
+        element, parent = stack.pop()
+        if not hasattr(element, "children"):
+            element.children = []
+        if getattr(element, "parent", _UNSET) is not parent:
+            element.parent = parent
+        yield element
+
+        children = element.children
+        if isinstance(children, str):
+            continue  # Text leaves (e.g. RawText) hold a string, not elements to walk
+        for i in range(len(children) - 1, -1, -1):  # Reversed so the first child pops first
+            child = children[i]
+            if isinstance(child, str):
+                child = RawString(child)
+                if isinstance(children, list):
+                    children[i] = child  # Wrap once; later walks find the element
+            stack.append((child, element))
+
+_TYPE_NAMES = {}
+""" `get_type()` by element class, which marko recomputes on every call """
+
+def _type_name(elem):
+    """
+    The marko type of an element, cached per class. This is not simply
+    `type(elem).__name__`: overriding elements such as SemanticLink report the type
+    they replace.
+    """
+    cls = type(elem)
+    name = _TYPE_NAMES.get(cls)
+    if name is None:
+        name = _TYPE_NAMES[cls] = elem.get_type()
+    return name
 
-    for child in element.children:
-        for elem in _iterate_element_td_df(child, parent = element):
-            yield elem
+def index_document(document: Document):
+    """
+    Group every element of a marko Document by type in a single walk. Each entry is
+    a (position, element) pair so that lists of several types can be merged back
+    into document order.
+    """
+    index = defaultdict(list)
+    for pos, elem in enumerate(iterate_document(document)):
+        index[_type_name(elem)].append((pos, elem))
+    return index
 
-def filter_document(document: Document, filter_type, filter_func = lambda _: True):
+def cached_index(document: Document):
     """
-    Get all elements matching the type of the string or list of strings filter_type
-    and passing the filter function.
+    The `index_document` index of a document, built on first use and kept on the
+    document itself; documents are not edited once they are loaded.
     """
-    matching = []
-    for elem in iterate_document(document):
-        if isinstance(filter_type, list):
-            if elem.get_type() in filter_type and filter_func(elem):
-                matching.append(elem)
-        else:
-            if elem.get_type() == filter_type and filter_func(elem):
-                matching.append(elem)
-    return matching
+    index = getattr(document, "_type_index", None)
+    if index is None:
+        index = document._type_index = index_document(document)
+    return index
+
+def filter_document(document: Document, filter_type, filter_func = None, index=None):
+    """
+    Get all elements matching the type of the string or collection of strings
+    filter_type and passing the filter function, if one is given.
+
+    The document is walked once and its index cached (see `cached_index`), so later
+    filters of any types are lookups; an explicit `index` is used as given.
+    """
+    if index is None:
+        index = cached_index(document)
+    if isinstance(filter_type, (list, tuple, set, frozenset)):
+        types = frozenset(filter_type)
+    else:
+        types = (filter_type,)
+    matching = heapq.merge(*(index.get(t, ()) for t in types))
+    if filter_func is None:
+        return [elem for _, elem in matching]
+    return [elem for _, elem in matching if filter_func(elem)]
+
+_LINK_TYPES = frozenset(("Link", "InternalLink", "FormatLink"))
+""" Element types that may carry a semantic predicate """
 
 def collect_semlinks(doc_map):
-    """ Collects all semantic-style links by document """
+    """
+    Collects all semantic-style links by document in a single walk of each, as
+    parallel lists of the links' objects, predicates, and elements.
+    """
     for name, document in doc_map.items():
+        objects, predicates, elements = [], [], []
+        # Through the cached index, so later filters of the same document don't walk it
+        for elem in filter_document(document, _LINK_TYPES):
+            if hasattr(elem, "predicate"):
+                objects.append(elem.object)
+                predicates.append(elem.predicate)
+                elements.append(elem)
         doc_map[name] = {
             "document": document,
-            "links": filter_document(
-                document,
-                ["Link", "InternalLink", "FormatLink"],
-                lambda e: hasattr(e, "predicate")
-            )
+            "objects": objects,
+            "predicates": predicates,
+            "elements": elements,
         }
     return doc_map
 
 
+_CACHEABLE_TYPES = (type(None), bool, int, float, complex, str, bytes, np.generic)
+
+
+def _cacheable(value):
+    """ Whether a calculation argument is immutable, so a result keyed on it stays valid """
+    if isinstance(value, tuple):
+        return all(_cacheable(item) for item in value)
+    # Property maps and arrays hash by identity but are edited in place
+    return isinstance(value, _CACHEABLE_TYPES)
+
+
 class DocumentVertex:
     """
     A convenience wrapper around vertices in a DocumentGraph that makes
     properties easier to access and use.
     """
 
+    __slots__ = ("docgraph", "vertex")
+
+    _INDEXES = {"names": "name_index", "uuids": "uuid_index"}
+    """ The DocumentGraph lookup map that each indexed vertex property keys """
+
     def __init__(self, docgraph, vertex):
         self.docgraph = docgraph
         self.vertex = vertex
 
-        self.in_degree = self.vertex.in_degree
-        self.out_degree = self.vertex.out_degree
-        self.is_valid = self.vertex.is_valid
+    def in_degree(self, *args, **kwargs):
+        return self.vertex.in_degree(*args, **kwargs)
+
+    def out_degree(self, *args, **kwargs):
+        return self.vertex.out_degree(*args, **kwargs)
+
+    def is_valid(self):
+        return self.vertex.is_valid()
     
     def __getitem__(self, propname):
-        return self.docgraph.graph.vertex_properties[propname][self.vertex]
+        return self.docgraph.vprops[propname][self.vertex]
     
     def __setitem__(self, propname, value):
-        self.docgraph.graph.vertex_properties[propname][self.vertex] = value
+        prop = self.docgraph.vprops[propname]
+        if propname in self._INDEXES:
+            index = getattr(self.docgraph, self._INDEXES[propname])
+            position = int(self.vertex)
+            if index.get(prop[self.vertex]) == position:
+                del index[prop[self.vertex]]
+            index[value] = position
+        prop[self.vertex] = value
+        self.docgraph._invalidate_caches()
     
     def _wrap_vertex_iterator(self, iterator):
         for vertex in iterator:
@@ -169,12 +264,7 @@ class DocumentVertex:
         return self._wrap_vertex_iterator(self.vertex.out_neighbors())
     
     def shortest_path_to(self, other, **kwargs):
-        vertices, edges = topology.shortest_path(
-            self.docgraph.graph,
-            self.vertex,
-            other.vertex,
-            **kwargs,
-        )
+        vertices, edges = self.docgraph.shortest_path(self.vertex, other.vertex, **kwargs)
         return (
             [DocumentVertex(self.docgraph, v) for v in vertices],
             [DocumentEdge(self.docgraph, e) for e in edges],
@@ -186,17 +276,21 @@ class DocumentEdge:
     A convenience wrapper around edges in a DocumentGraph
     """
 
+    __slots__ = ("docgraph", "edge")
+
     def __init__(self, docgraph, edge):
         self.docgraph = docgraph
         self.edge = edge
 
-        self.is_valid = self.edge.is_valid
+    def is_valid(self):
+        return self.edge.is_valid()
 
     def __getitem__(self, propname):
-        return self.docgraph.graph.edge_properties[propname][self.edge]
+        return self.docgraph.eprops[propname][self.edge]
     
     def __setitem__(self, propname, value):
-        self.docgraph.graph.edge_properties[propname][self.edge] = value
+        self.docgraph.eprops[propname][self.edge] = value
+        self.docgraph._invalidate_caches()
 
     def __str__(self):
         return f"'{self.source().name}' -[{','.join(self.predicates)}]-> '{self.target().name}'"
@@ -246,108 +340,145 @@ class DocumentGraph:
     def load(cls, path):
         return cls(graph=load_graph(path, fmt="gt"))
 
-    def __init__(self, content_dir=None, graph=None):
-        self.__class__._setup_calculations()
-        if bool(content_dir) == bool(graph):
+    def __init__(self, content_dir=None, graph=None, parent=None, parse_workers=0):
+        if (content_dir is None) == (graph is None):
             raise Exception("Exactly one of `content_dir` or `graph` must be set!")
-        self.graph = graph or Graph(directed=True)
-        self.vertex_map = {}
-        self.vertex_id_map = {}
-        self.edge_map = {}
-
-        class _edge_props():
-            def __setattr__(_, name, value):
-                self.graph.edge_properties[name] = value
-            
-            def __getattr__(_, name):
-                return self.graph.edge_properties[name]
-
-        class _vertex_props():
-            def __setattr__(_, name, value):
-                self.graph.vertex_properties[name] = value
-            
-            def __getattr__(_, name):
-                return self.graph.vertex_properties[name]
-
-        class _graph_props():
-            def __setattr__(_, name, value):
-                self.graph.graph_properties[name] = value
-            
-            def __getattr__(_, name):
-                return self.graph.graph_properties[name]
-
-        class _graph_props():
-            """ Some convenience classes to make internal PropertyMaps easier """
-            edge = _edge_props()
-            vertex = _vertex_props()
-            graph = _graph_props()
-
-        self.props = _graph_props()
-
-        if content_dir:
-            self._build_graph(content_dir)
+        self.graph = graph if graph is not None else Graph(directed=True)
+        self.name_index = {}
+        """ Vertex index by document name; edges are found with `edge_between` """
+        self.uuid_index = {}
+        """ Vertex index by uuid """
+        self._predicate_index = None
+        self._predicate_matrix = None
+        self._predicate_counts = None
+        self._calculations = {}
+        """ Results of `calculate` by (name, sorted kwargs) """
+        self._shortest_paths = OrderedDict()
+        """ Recent unweighted `shortest_path` results by (source, target) index, oldest first """
+
+        self._bind_property_maps()
+        if content_dir is not None:
+            self._build_graph(content_dir, parse_workers)
+        elif parent is not None:
+            self._inherit_maps(parent)
         else:
             self._populate_map()
         
+    def _bind_property_maps(self):
+        """
+        Bind the graph's live property dicts once, rather than building a new proxy on
+        every property access; maps added later are visible through them.
+        """
+        self.vprops = self.graph.vertex_properties
+        self.eprops = self.graph.edge_properties
+
     def _populate_map(self):
-        for vertex in self.vertices:
-            self.vertex_map[vertex.name] = vertex.vertex
-            self.vertex_id_map[vertex.uuid] = vertex.vertex
-        for edge in self.edges:
-            self.edge_map[(
-                edge.source().name,
-                edge.target().name,
-            )] = edge
-
-    def _build_graph(self, content_dir):
-        doc_map, json_map = load_content(content_dir)
+        # Read the property maps directly instead of wrapping every vertex and edge
+        names = self.vprops["names"]
+        uuids = self.vprops["uuids"]
+        for vertex in self.graph.vertices():
+            index = int(vertex)
+            self.name_index[names[vertex]] = index
+            self.uuid_index[uuids[vertex]] = index
+
+    @staticmethod
+    def _filter_array(filt):
+        """ The boolean array a (filter, inverted) pair keeps, or None if there is no filter """
+        prop, inverted = filt
+        if prop is None:
+            return None
+        return prop.a.astype(bool) != inverted
+
+    def _inherit_maps(self, parent):
+        """
+        Take the lookup maps of the graph this one views instead of reading every name
+        back out of the property maps. Vertices the view filters out are dropped; with
+        no vertex filter the parent's maps are shared outright.
+        """
+        vkeep = self._filter_array(self.graph.get_vertex_filter())
+        if vkeep is None:
+            self.name_index = parent.name_index
+            self.uuid_index = parent.uuid_index
+        else:
+            self.name_index = {k: i for k, i in parent.name_index.items() if vkeep[i]}
+            self.uuid_index = {k: i for k, i in parent.uuid_index.items() if vkeep[i]}
+
+    def _build_graph(self, content_dir, parse_workers=0):
+        doc_map, json_map = load_content(content_dir, workers=parse_workers)
         doc_map = collect_semlinks(doc_map)
-        vertices = self.graph.add_vertex(len(doc_map))
-        self.props.vertex.names = self.graph.new_vertex_property("string")
-        self.props.vertex.uuids = self.graph.new_vertex_property("string")
-        self.props.vertex.documents = self.graph.new_vertex_property("python::object")
-        self.props.vertex.document_json = self.graph.new_vertex_property("python::object")
-
-        for name, vertex in zip(doc_map.keys(), vertices):
-            self.vertex_map[name] = vertex
-            self.props.vertex.names[vertex] = name
-            self.props.vertex.uuids[vertex] = uuid4()  # TODO we need bidirection persistence...
-            self.props.vertex.documents[vertex] = doc_map[name]["document"]
-            self.props.vertex.document_json[vertex] = json_map[name]
-
-            self.vertex_id_map[self.props.vertex.uuids[vertex]] = vertex
-
-        self.props.edge.predicates = self.graph.new_edge_property("vector<string>")
-        self.props.edge.element_lists = self.graph.new_edge_property("python::object")
+        self.graph.add_vertex(len(doc_map))
+        vertices = list(self.graph.vertices())  # add_vertex returns a lone Vertex when n == 1
+        names = self.graph.new_vertex_property("string")
+        vertex_uuids = self.graph.new_vertex_property("string")
+        documents = self.graph.new_vertex_property("python::object")
+        document_json = self.graph.new_vertex_property("python::object")
+        vertex_properties = self.graph.vertex_properties
+        vertex_properties["names"] = names
+        vertex_properties["uuids"] = vertex_uuids
+        vertex_properties["documents"] = documents
+        vertex_properties["document_json"] = document_json
+
+        # TODO we need bidirection persistence...
+        # One urandom read for every uuid rather than a uuid4() call per vertex
+        raw = os.urandom(16 * len(vertices))
+        uuids = [str(UUID(bytes=raw[i:i + 16], version=4)) for i in range(0, len(raw), 16)]
+
+        for name, uuid, vertex in zip(doc_map.keys(), uuids, vertices):
+            names[vertex] = name
+            vertex_uuids[vertex] = uuid
+            documents[vertex] = doc_map[name]["document"]
+            document_json[vertex] = json_map[name]
+        # Vertices are added in doc_map order, so each one's index is its position
+        self.name_index = {name: i for i, name in enumerate(doc_map)}
+        self.uuid_index = {uuid: i for i, uuid in enumerate(uuids)}
+
+        predicates = self.graph.new_edge_property("vector<string>")
+        element_lists = self.graph.new_edge_property("python::object")
+        self.graph.edge_properties["predicates"] = predicates
+        self.graph.edge_properties["element_lists"] = element_lists
+        # Gather each (source, target) pair's links in plain lists first, so the edges
+        # can be added in one call and every property written once
+        edge_predicates = defaultdict(list)
+        edge_elements = defaultdict(list)
+        known = set(doc_map)
         for name, dct in doc_map.items():
-            for link in dct["links"]:
-                obj = link.object
-                if obj in doc_map:
-                    edge = self.edge_map.get((name, obj))
-                    if edge is None:
-                        edge = self.graph.add_edge(self.vertex_map[name], self.vertex_map[obj])
-                        self.edge_map[(name, obj)] = edge
-                    self.props.edge.predicates[edge] = [
-                        *self.props.edge.predicates[edge],
-                        link.predicate,
-                    ]
-                    self.props.edge.element_lists[edge] = [
-                        *(self.props.edge.element_lists[edge] or []),
-                        link,
-                    ]
+            for obj, predicate, element in zip(dct["objects"], dct["predicates"], dct["elements"]):
+                if obj in known:
+                    pair = (name, obj)
+                    edge_predicates[pair].append(predicate)
+                    edge_elements[pair].append(element)
                 else:
                     pass # TODO handle link to nonexistent
 
+        # The graph has no edges yet, so the i-th pair becomes the edge with index i
+        position = self.name_index
+        pairs = list(edge_predicates)
+        self.graph.add_edge_list(
+            np.array([(position[src], position[tgt]) for src, tgt in pairs], dtype=np.int64)
+            .reshape(-1, 2)
+        )
+        edge_index = self.graph.edge_index
+        for edge in self.graph.edges():
+            pair = pairs[edge_index[edge]]
+            predicates[edge] = edge_predicates[pair]
+            element_lists[edge] = edge_elements[pair]
+        self._invalidate_caches()
+
     @property
     def vertices(self):
         for vertex in self.graph.vertices():
             yield DocumentVertex(self, vertex)
     
     def __getitem__(self, name):
-        return DocumentVertex(self, self.vertex_map[name])
+        return DocumentVertex(self, self.graph.vertex(self.name_index[name]))
     
     def get_vertex_by_id(self, id):
-        return DocumentVertex(self, self.vertex_id_map[id])
+        return DocumentVertex(self, self.graph.vertex(self.uuid_index[id]))
+
+    def edge_between(self, source, target):
+        """ The edge from one named document to another, or None if they aren't linked """
+        edge = self.graph.edge(self.name_index[source], self.name_index[target])
+        return None if edge is None else DocumentEdge(self, edge)
 
     @property
     def edges(self):
@@ -384,95 +515,182 @@ class DocumentGraph:
                 elif kwargs:
                     pass
 
+    SHORTEST_PATH_CACHE_SIZE = 1024
+    """ How many unweighted shortest paths `shortest_path` remembers per graph """
+
+    _CACHED_PROPERTIES = (
+        "pgraph_in", "pgraph_ref", "pgraph_embed", "pgraph_media", "pgraph_tags",
+        "graphql_schema",
+    )
+    """ The cached_property values that `_invalidate_caches` must drop """
+
+    def _invalidate_caches(self):
+        """
+        Forget everything derived from the graph's properties; the vertex and edge
+        wrappers call this on every write, and anything else mutating the graph must too
+        """
+        self._predicate_index = None
+        self._predicate_matrix = None
+        self._predicate_counts = None
+        self._calculations.clear()
+        self._shortest_paths.clear()
+        for name in self._CACHED_PROPERTIES:
+            self.__dict__.pop(name, None)
+
+    def _index_predicates(self):
+        """ Build the predicate matrix and counts together in one pass over the edges """
+        predicates = self.eprops["predicates"]
+        edge_index = self.graph.edge_index
+        index = {}
+        rows = []
+        cols = []
+        for edge in self.graph.edges():
+            row = edge_index[edge]
+            for predicate in predicates[edge]:
+                rows.append(row)
+                cols.append(index.setdefault(predicate, len(index)))
+        matrix = np.zeros((self.graph.edge_index_range, len(index)), dtype=bool)
+        matrix[rows, cols] = True
+        # Count from the same column list rather than a dict update per (edge, predicate)
+        counts = np.bincount(np.asarray(cols, dtype=np.intp), minlength=len(index))
+        self._predicate_index = index
+        self._predicate_matrix = matrix
+        self._predicate_counts = dict(zip(index, counts.tolist()))
+
     @property
     def predicate_counts(self):
         """ Get a dictionary of all predicates with the number of times they appear """
-        counts = {}
-        for edge in self.edges:
-            for predicate in self.props.edge.predicates[edge.edge]:
-                counts[predicate] = counts.get(predicate, 0) + 1
-        return counts
+        if self._predicate_counts is None:
+            self._index_predicates()
+        return self._predicate_counts
     
     @property
     def predicates(self):
         """ Get a list of all unique predicates """
         return list(self.predicate_counts.keys())
     
+    @property
+    def predicate_index(self):
+        """ The column of `predicate_matrix` for each predicate """
+        if self._predicate_index is None:
+            self._index_predicates()
+        return self._predicate_index
+
+    @property
+    def predicate_matrix(self):
+        """ A boolean (edge index x predicate) matrix marking the predicates each edge carries """
+        if self._predicate_matrix is None:
+            self._index_predicates()
+        return self._predicate_matrix
+
     def predicate_masked(self, predicate, raw=False):
         """ Return a masked graph using only the given predicate(s) """
-        if isinstance(predicate, list):
-            mask = np.array(
-                [bool(set(predicate) & set(plist)) for plist in self.props.edge.predicates]
-            )
-        else:
-            mask = np.array([predicate in plist for plist in self.props.edge.predicates])
+        index = self.predicate_index
+        cols = [
+            index[pred]
+            for pred in (predicate if isinstance(predicate, list) else [predicate])
+            if pred in index
+        ]
+        mask = self.graph.new_edge_property("bool")
+        mask.a = self.predicate_matrix[:, cols].any(axis=1)
         if raw:
             return GraphView(self.graph, efilt=mask)
         else:
-            return DocumentGraph(graph=GraphView(self.graph, efilt=mask))
+            return DocumentGraph(graph=GraphView(self.graph, efilt=mask), parent=self)
     
-    @property
+    @cached_property
     def pgraph_in(self):
         """ Convenience masked graph filtering on the 'in' predicate """
         return self.predicate_masked("in", raw=False)
     
-    @property
+    @cached_property
     def pgraph_ref(self):
         """ Convenience masked graph filtering on the 'ref' predicate """
         return self.predicate_masked("ref", raw=False)
     
-    @property
+    @cached_property
     def pgraph_embed(self):
         """ Convenience masked graph filtering on the 'embed' predicate """
         return self.predicate_masked("embed", raw=False)
     
-    @property
+    @cached_property
     def pgraph_media(self):
         """ Convenience masked graph filtering on the 'media' predicate """
         return self.predicate_masked("media", raw=False)
     
-    @property
+    @cached_property
     def pgraph_tags(self):
         """ Convenience masked graph filtering on the tagging predicates """
         return self.predicate_masked(["is", "has", "about", "uses", "tag"], raw=False)
     
     def vertices_in_from(self, vertex):
+        """ The vertex, then every vertex with a path into it, each once and breadth-first """
         yield vertex
-        for neighboor in vertex.in_neighbors():
-            for subv in self.vertices_in_from(neighboor):
-                yield subv
-    
+        # Walking out-edges of the reversed view follows in-edges, in C and with a
+        # visited set, so cycles and diamonds no longer recurse forever
+        reverse = GraphView(self.graph, reversed=True)
+        for edge in search.bfs_iterator(reverse, vertex.vertex):
+            yield DocumentVertex(self, self.graph.vertex(int(edge.target())))
+    
+    def _reaching_filter(self, view, root_name, include_root):
+        """ A vertex filter selecting the vertices of `view` with a path into the named root """
+        root = self.name_index[root_name]
+        reverse = GraphView(view, reversed=True)
+        vfilt = self.graph.new_vertex_property("bool")
+        vfilt.a = topology.label_out_component(reverse, reverse.vertex(root)).a
+        if not include_root:
+            vfilt.a[root] = False
+        return vfilt
+
     def subgraph_predicate_around(self, root, predicate, include_root=True):
         """ Return a subgraph of the graph around the given vertex, filtered by the given predicate """
-        pgraph = self.predicate_masked(predicate, raw=False)
-        root = pgraph[root.name]
-        gen = (v.vertex for v in pgraph.vertices_in_from(root))
-        if include_root:
-            selected = set(gen)
-        else:
-            next(gen)
-            selected = set(gen)
-        return DocumentGraph(graph=GraphView(self.graph, vfilt=lambda v: v in selected))
+        pgraph = self.predicate_masked(predicate, raw=True)
+        vfilt = self._reaching_filter(pgraph, root.name, include_root)
+        return DocumentGraph(graph=GraphView(self.graph, vfilt=vfilt), parent=self)
 
     def subgraph_around(self, root, include_root=True):
         """ Uses the 'in' predicate to get the subgraph around a root """
-        ingraph = self.pgraph_in
-        root = ingraph[root.name]
-        gen = (v.vertex for v in ingraph.vertices_in_from(root))
-        if include_root:
-            selected = set(gen)
-        else:
-            next(gen)
-            selected = set(gen)
-        return DocumentGraph(graph=GraphView(self.graph, vfilt=lambda v: v in selected))
+        vfilt = self._reaching_filter(self.pgraph_in.graph, root.name, include_root)
+        return DocumentGraph(graph=GraphView(self.graph, vfilt=vfilt), parent=self)
     
     def vertices_of_type(self, type_name):
         """ Get a set of vertices linked to the given type by an 'is' predicate """
-        return (
-            self[v.name]
-            for v in self.subgraph_predicate_around(self[type_name], "is", include_root=False).vertices
+        # Read the filter directly; a whole subgraph DocumentGraph would rebuild its maps
+        # and wrap every vertex just to look each one up again by name
+        vfilt = self._reaching_filter(
+            self.predicate_masked("is", raw=True), type_name, include_root=False,
         )
-    
+        return (DocumentVertex(self, self.graph.vertex(int(i))) for i in np.flatnonzero(vfilt.a))
+    
+    def shortest_path(self, source, target, **kwargs):
+        """
+        The raw vertices and edges of a shortest path between two graph-tool vertices.
+        Plain unweighted searches are cached, since navigation asks for the same pairs
+        repeatedly; any keyword arguments bypass the cache.
+        """
+        if kwargs:
+            return topology.shortest_path(self.graph, source, target, **kwargs)
+        return self._cached_shortest_path(int(source), int(target))
+
+    def _cached_shortest_path(self, source, target):
+        """
+        An unweighted shortest path between two vertex indices as (vertices, edges)
+        tuples, so callers can't edit the shared result; least recently used paths are
+        dropped past `SHORTEST_PATH_CACHE_SIZE`.
+        """
+        key = (source, target)
+        path = self._shortest_paths.get(key)
+        if path is not None:
+            self._shortest_paths.move_to_end(key)
+            return path
+        vertices, edges = topology.shortest_path(
+            self.graph, self.graph.vertex(source), self.graph.vertex(target),
+        )
+        path = self._shortest_paths[key] = (tuple(vertices), tuple(edges))
+        if len(self._shortest_paths) > self.SHORTEST_PATH_CACHE_SIZE:
+            self._shortest_paths.popitem(last=False)
+        return path
+
     def save(self, path):
         self.graph.save(path, fmt="gt")
     
@@ -493,9 +711,20 @@ class DocumentGraph:
             raise Exception(f"Unknown layout '{kind}'")
     
     def calculate(self, name, **kwargs):
+        """
+        Run a registered calculation on the graph. Results for immutable arguments are
+        cached, and each call gets its own copy, so callers may edit what they get.
+        """
         if name not in self.__class__.calc_functions:
             raise Exception(f"Unknown calculation '{name}'")
-        return self.__class__.calc_functions[name](self.graph, **kwargs)
+        function = self.__class__.calc_functions[name]
+        if not all(_cacheable(value) for value in kwargs.values()):
+            return function(self.graph, **kwargs)  # e.g. weight maps; never cached
+        key = (name, tuple(sorted(kwargs.items())))
+        if key not in self._calculations:
+            self._calculations[key] = function(self.graph, **kwargs)
+        result = self._calculations[key]
+        return result.copy() if hasattr(result, "copy") else result
 
     def draw(self, size_calc=None, **kwargs):
         vsize = 24
@@ -503,21 +732,21 @@ class DocumentGraph:
             vsize = self.calculate(size_calc)
         graph_draw(
             self.graph,
-            vertex_text=self.props.vertex.names,
+            vertex_text=self.vprops["names"],
             vertex_text_position=-1.1,
             vertex_size=vsize,
 
-            edge_text=self.props.edge.predicates,
+            edge_text=self.eprops["predicates"],
             edge_text_color="white",
             edge_font_size=14,
             **kwargs
         )
     
-    @property
+    @cached_property
     def graphql_schema(self):
-        """ Get a Graphene-generated GraphQL schema for API resolution """
+        """ Get a Graphene-generated GraphQL schema for API resolution, built once """
         
-        NodeValueObject = namedtuple("Node", ["id", "name", "document", "graph"])
+        NodeValueObject = namedtuple("Node", ["id", "name", "document", "graph", "vertex"])
         class Node(ObjectType):
             id = graphene.ID(required=True)
             name = graphene.String(required=True)
@@ -538,42 +767,43 @@ class DocumentGraph:
                     name=vertex.name,
                     document=vertex.document_json,
                     graph=vertex.docgraph,
+                    vertex=vertex,
                 )
             
             def resolve_all_neighbors(root, info):
                 return [
                     Node.from_vertex(v)
-                    for v in root.graph[root.name].all_neighbors()
+                    for v in root.vertex.all_neighbors()
                 ]
             
             def resolve_in_neighbors(root, info):
                 return [
                     Node.from_vertex(v)
-                    for v in root.graph[root.name].in_neighbors()
+                    for v in root.vertex.in_neighbors()
                 ]
             
             def resolve_out_neighbors(root, info):
                 return [
                     Node.from_vertex(v)
-                    for v in root.graph[root.name].out_neighbors()
+                    for v in root.vertex.out_neighbors()
                 ]
         
             def resolve_all_edges(root, info):
                 return [
                     Edge.from_edge(e)
-                    for e in root.graph[root.name].all_edges()
+                    for e in root.vertex.all_edges()
                 ]
             
             def resolve_in_edges(root, info):
                 return [
                     Edge.from_edge(e)
-                    for e in root.graph[root.name].in_edges()
+                    for e in root.vertex.in_edges()
                 ]
             
             def resolve_out_edges(root, info):
                 return [
                     Edge.from_edge(e)
-                    for e in root.graph[root.name].out_edges()
+                    for e in root.vertex.out_edges()
                 ]
             
         EdgeValueObject = namedtuple("Edge", ["source", "target", "predicates", "element"])
@@ -649,4 +879,7 @@ class DocumentGraph:
 
         return Schema(
             query=Query,
-        )
\ No newline at end of file
+        )
+
+
+DocumentGraph._setup_calculations()
@@ -8,7 +8,13 @@ Copyright (c) 2022 Ben Croisdale. All rights reserved.
 Released under the Apache 2.0 license as described in the file LICENSE.
 """
 
+import os
 import re
+import pickle
+import hashlib
+from pathlib import Path
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 from collections import namedtuple
 
 import marko
@@ -18,6 +24,8 @@ from marko.block import parser, BlockElement, BlankLine
 from marko.inline import InlineElement, Link
 from marko.ast_renderer import ASTRenderer
 
+from storage import AST_CACHE
+
 
 class SemanticLink(Link):
     override = True
@@ -37,7 +45,12 @@ class SemanticLink(Link):
             del self.dest
 
 class InternalLink(InlineElement):
-    pattern = r"\[\[ *(.+?) *(\| *(.+?) *)?\]\]"
+    # Each part starts and ends on a non-space and excludes its delimiters, so the
+    # surrounding ` *` runs are the only way to match padding and nothing backtracks
+    pattern = re.compile(
+        r"\[\[ *([^ |\]\n](?:[^|\]\n]*[^ |\]\n])?) *"
+        r"(\| *([^ \]\n](?:[^\]\n]*[^ \]\n])?) *)?\]\]"
+    )
     parse_children = True
 
     def __init__(self, match):
@@ -62,7 +75,7 @@ class InternalLink(InlineElement):
 
 
 class FormatLink(InlineElement):
-    pattern = r"\{\[ *(.+) *\]\}(.*)\{\[ */\1 *\]\}"
+    pattern = re.compile(r"\{\[ *([^ \]\n](?:[^\]\n]*[^ \]\n])?) *\]\}(.*)\{\[ */\1 *\]\}")
     parse_children = True
 
     def __init__(self, match):
@@ -76,7 +89,7 @@ class LinkExtension:
 
 class InlineLatex(InlineElement):
     priority = 7
-    pattern = r"\$(.*)\$"
+    pattern = re.compile(r"\$(.*)\$")
     parse_children = False
 
     def __init__(self, match):
@@ -86,7 +99,7 @@ class InlineLatex(InlineElement):
 class BlockLatex(InlineElement):
     """ \[ \]"""
     priority = 8
-    pattern = r"\$\$([\s\S]*)\$\$"
+    pattern = re.compile(r"\$\$([\s\S]*)\$\$")
     parse_children = False
 
     def __init__(self, match):
@@ -175,11 +188,13 @@ class DirectiveOption(BlockElement):
 
 
 class DirectiveContent(BlockElement):
-    _prefix = r" {3}"
+    _prefix = " {3}"
+    """ marko joins the `_prefix` of every open state into a string, so this stays one """
+    prefix_pattern = re.compile(r" {3}")
 
     @classmethod
     def match(cls, source: Source):
-        m = source.expect_re(cls._prefix)
+        m = source.expect_re(cls.prefix_pattern)
         if not m:
             return False
         
@@ -190,25 +205,23 @@ class DirectiveContent(BlockElement):
     @classmethod
     def parse(cls, source: Source):
         state = cls()
-        state.content = ""
+        parts = []  # Joined once at the end rather than growing a string per line
         source.consume()
         source.anchor()
         while not source.exhausted:
             line = source.next_line()
             if line is not None and not line.strip():
                 source.consume()
-                stripped_line = line.strip()
-                if stripped_line:
-                    state.content += line
-                else:
-                    state.content += "\n"
+                parts.append("\n")
             elif cls.match(source):
-                state.content += line + "\n"
+                parts.append(line)
+                parts.append("\n")
                 source.consume()
                 source.anchor()
             else:
                 source.reset()
                 break
+        state.content = "".join(parts)
         return state
 
 class DirectiveExtension:
@@ -218,23 +231,27 @@ def recursive_load(root_dir, parent=""):
     """ TODO: still not sure what to do about name collisions... """
     ignore_dirs = ["__pycache__", ".git"]
     raw_map = {}
-    this = root_dir / "this.md"
-    if this.exists():
-        with this.open("r") as f:
+    # scandir entries already know their type, so nothing below stats a child again
+    with os.scandir(root_dir) as it:
+        entries = list(it)
+    has_this = any(entry.name == "this.md" for entry in entries)
+    if has_this:
+        with (root_dir / "this.md").open("r") as f:
             raw_map[root_dir.stem] = (parent and f"[[in|{parent}]]\n") + f.read()
-    parent_group = root_dir.stem if this.exists() else parent
-    for child in root_dir.iterdir():
-        if child.stem in ignore_dirs:
+    parent_group = root_dir.stem if has_this else parent
+    for entry in entries:
+        stem = Path(entry.name).stem
+        if stem in ignore_dirs:
             continue
-        elif child.stem == "this":
+        elif stem == "this":
             continue
-        elif child.is_dir():
+        elif entry.is_dir():
             raw_map.update(
-                recursive_load(child, parent=parent_group)
+                recursive_load(root_dir / entry.name, parent=parent_group)
             )
         else:
-            with child.open("r") as f:
-                raw_map[child.stem] = (f"[[in|{parent_group}]]\n" if parent_group else "")\
+            with open(entry.path, "r") as f:
+                raw_map[stem] = (f"[[in|{parent_group}]]\n" if parent_group else "")\
                     + f.read()
     return raw_map
 
@@ -254,14 +271,89 @@ def make_renderer():
 renderer = make_renderer()
 
 
-def load_content(content_dir):
+def _parser_version():
+    """ Cached ASTs are only valid for the marko release and extensions that built them """
+    return marko.__version__, Path(__file__).stat().st_mtime_ns
+
+
+def _ast_cache_path(content_dir):
+    """
+    Each content directory gets its own cache file, so loading one corpus never prunes
+    another's entries
+    """
+    key = hashlib.blake2b(str(Path(content_dir).resolve()).encode(), digest_size=8).hexdigest()
+    return AST_CACHE.with_name(f"{AST_CACHE.stem}-{key}{AST_CACHE.suffix}")
+
+
+def _load_ast_cache(path):
+    """ Pickled (ast, json) pairs by content digest from the last load of the directory """
+    try:
+        with path.open("rb") as f:
+            version, entries = pickle.load(f)
+    except Exception:  # Missing, unreadable or from an incompatible build: start cold
+        return {}
+    return entries if version == _parser_version() else {}
+
+
+def _save_ast_cache(path, entries):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    partial = path.with_suffix(".partial")
+    with partial.open("wb") as f:
+        pickle.dump((_parser_version(), entries), f, protocol=pickle.HIGHEST_PROTOCOL)
+    partial.replace(path)
+
+
+_PARALLEL_PARSE_MIN = 64
+""" Below this many documents to parse, starting worker processes costs more than it saves """
+
+
+def _parse_entry(raw):
+    """ Parse and render one document into a pickled cache entry; runs in the workers """
+    ast = renderer.parse(raw)
+    return pickle.dumps((ast, renderer.render(ast)), protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def _parse_entries(raws, workers=0):
+    """
+    Documents are independent, so a large batch can be split over `workers` processes.
+    Workers are spawned, never forked, so a threaded caller (e.g. the server) is safe.
+    """
+    if workers < 2 or len(raws) < _PARALLEL_PARSE_MIN:
+        return [_parse_entry(raw) for raw in raws]
+    with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            ) as executor:
+        return list(executor.map(_parse_entry, raws, chunksize=8))
+
+
+def load_content(content_dir, workers=0):
+    """
+    Parse every document under `content_dir`. Parallel parsing is opt-in: pass the
+    number of worker processes to use for the documents that miss the cache.
+    """
     content_map = recursive_load(content_dir)
     ast_map = {}
     json_map = {}
 
-    for name, raw in content_map.items():
-        ast_map[name] = renderer.parse(raw)
-        json_map[name] = renderer.render(ast_map[name])
-        # print(renderer.render(ast_map[name]))
-    
+    # Only parse files whose text changed since the last load. Entries stay pickled so
+    # every document unpickles its own AST, even when two files have the same text
+    cache_path = _ast_cache_path(content_dir)
+    cache = _load_ast_cache(cache_path)
+    digests = {
+        name: hashlib.blake2b(raw.encode(), digest_size=16).hexdigest()
+        for name, raw in content_map.items()
+    }
+    missing = {
+        digest: content_map[name] for name, digest in digests.items() if digest not in cache
+    }
+    entries = {digest: cache[digest] for digest in digests.values() if digest in cache}
+    entries.update(zip(missing, _parse_entries(list(missing.values()), workers)))
+    for name, digest in digests.items():
+        ast_map[name], json_map[name] = pickle.loads(entries[digest])
+
+    # Rewrite only when files changed; dropping unused digests keeps the cache bounded
+    if entries.keys() != cache.keys():
+        _save_ast_cache(cache_path, entries)
+
     return ast_map, json_map
\ No newline at end of file
@@ -8,6 +8,8 @@ Copyright (c) 2022 Ben Croisdale. All rights reserved.
 Released under the Apache 2.0 license as described in the file LICENSE.
 """
 
+import functools
+from collections import deque
 from typing import List
 
 
@@ -22,30 +24,55 @@ class Node:
         return cls
     
     @classmethod
+    @functools.lru_cache(maxsize=None)
     def get_custom_handler(cls, snake_type):
+        """ Resolved once per (class, type); every converted element asks """
         if hasattr(cls, f"handle_{snake_type}"):
             return getattr(cls, f"handle_{snake_type}")
         return None
     
     @classmethod
     def convert_tree(cls, tree):
+        pending = []
+        root = cls._convert_element(tree, pending)
+        while pending:
+            pending.pop()._convert_children(pending)
+        return root
+
+    @classmethod
+    def _convert_element(cls, tree, pending):
+        """
+        Convert a single element. Nodes are built without their children and queued on
+        `pending` instead, so deep documents never recurse.
+        """
         if isinstance(tree, str):
             return tree
-        handler = cls.get_custom_handler(tree.get_type(True))\
-                  or Node.element_handlers.get(tree.get_type())
+        custom = cls.get_custom_handler(tree.get_type(True))
+        if custom:
+            return custom(tree)
+        handler = Node.element_handlers.get(tree.get_type())
         if handler is None:
             print(f"No handler for type '{tree.get_type()}'")
-            return Node(tree)
-        return handler(tree)
+            handler = Node
+        node = handler(tree, convert_children=False)
+        pending.append(node)
+        return node
 
-    def __init__(self, element):
+    def __init__(self, element, convert_children=True):
         self.element = element
         self.parent: Node = None
         self.children: List[Node] = []
 
-        if hasattr(element, "children"):
-            for c in element.children:
-                child = self.convert_tree(c)
+        if convert_children:
+            pending = [self]
+            while pending:
+                pending.pop()._convert_children(pending)
+
+    def _convert_children(self, pending):
+        """ Convert this node's direct children, with this node's custom handlers """
+        if hasattr(self.element, "children"):
+            for c in self.element.children:
+                child = self._convert_element(c, pending)
                 if isinstance(child, Node):
                     child.parent = self
                 self.children.append(child)
@@ -65,6 +92,8 @@ class Node:
         """ A Generator that does a top-down, depth-first iteration of this and child nodes """
         yield self
         for child in self.children:
+            if not isinstance(child, Node):
+                continue
             for n in child.nodes_top_down_depth_first:
                 yield n
 
@@ -72,23 +101,21 @@ class Node:
     def nodes_bottom_up_depth_first(self):
         """ A Generator that does a bottom-up, depth-first iteration of this and child nodes """
         for child in self.children:
-            for n in child.nodes_bottom_depth_first:
+            if not isinstance(child, Node):
+                continue
+            for n in child.nodes_bottom_up_depth_first:
                 yield n
         yield self
 
     @property
     def nodes_top_down_breadth_first(self):
         """ A Generator that does a top-down, breadth-first iteration of this and child nodes """
-        yield self
-        has_more = not not self.children
-        child_iterators = [c.nodes_top_down_breadth_first for c in self.children]
-        while has_more:
-            has_more = False
-            for iterator in child_iterators:
-                node = next(iterator)
-                if node:
-                    has_more = True
-                    yield node
+        queue = deque([self])
+        while queue:
+            node = queue.popleft()
+            yield node
+            # Text children are plain strings, so only Nodes are expanded
+            queue.extend(child for child in node.children if isinstance(child, Node))
 
 
 @Node.element_handler
@@ -102,6 +129,11 @@ class Heading(Node):
     def handle_raw_text(cls, txt):
         pass
 
-from process.parse_markdown import apple
 
-check = Node.convert_tree(apple.ast)
\ No newline at end of file
+if __name__ == "__main__":
+    # Dev check against the bundled test content; never run on import
+    from pathlib import Path
+    from process.parse_markdown import renderer
+
+    apple = Path(__file__).parent / "test-content" / "group-c" / "apple.md"
+    check = Node.convert_tree(renderer.parse(apple.read_text()))
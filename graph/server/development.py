@@ -8,8 +8,8 @@ Copyright (c) 2022 Ben Croisdale. All rights reserved.
 Released under the Apache 2.0 license as described in the file LICENSE.
 """
 
-from exo_server import ServerHandler, DefaultSite
-from sites import (
+from .exo_server import ServerHandler, DefaultSite
+from .sites import (
     AdminSite,
 )
 
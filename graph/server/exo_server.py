@@ -89,15 +89,18 @@ class ServerHandler(metaclass=sv_meta):
         def __str__(self):
             return f"No site found for '{self.missing_site_name}'"
 
-    @classmethod
-    def register_servers(cls):
+    def __init_subclass__(cls, **kwargs):
         """
-        Register all servers that subclass ServerHandler.
+        Register all servers that subclass ServerHandler as they are defined.
         """
-        if cls._SERVERS:
-            raise ServerHandler.AlreadyRegisteredException()
-        for subclass in cls.__subclasses__():
-            cls._SERVERS[subclass.name] = subclass
+        super().__init_subclass__(**kwargs)
+        name = cls.__dict__.get("NAME")
+        if not name:
+            # If no NAME is specified, this is an abstract server class
+            return
+        if name in ServerHandler._SERVERS:
+            raise ServerHandler.AlreadyRegistered(name)
+        ServerHandler._SERVERS[name] = cls
 
     @classmethod
     def get_server_list(cls):
@@ -116,14 +119,15 @@ class ServerHandler(metaclass=sv_meta):
     @classmethod
     def simple_site(cls, name, url):
         """ Registers a very simple site that uses the default implementation """
-        new_site = type(f"Site_{name}", (Site,), {})
-        new_site.NAME = name.lower()
+        # NAME must be in the namespace so that Site.__init_subclass__ registers it
+        new_site = type(f"Site_{name}", (Site,), {"NAME": name.lower()})
         cls.SITES[new_site.NAME] = new_site(cls)
     
-    def __init__(self):
+    def __init__(self, parse_workers=0):
+        """ `parse_workers` processes parse the content; by default it is parsed serially """
         for site in self.SITES.values():
             site.server = self
-        self.document_graph = DocumentGraph(content_dir=CONTENT_ROOT)
+        self.document_graph = DocumentGraph(content_dir=CONTENT_ROOT, parse_workers=parse_workers)
         self.setup_routes()
     
     @cached_property
@@ -297,20 +301,18 @@ class Site(metaclass=site_meta):
         cls.VIEWS[None] = vfunc
         return vfunc
     
-    @classmethod
-    def register_sites(cls):
-        """
-        Register all sites that subclass Site.
-        """
-        if cls._SITES:
-            raise Site.AlreadyRegisteredException()
-        for subclass in cls.__subclasses__():
-            if subclass.NAME:
-                cls._SITES[subclass.NAME] = subclass
-            else:
-                # If no NAME is specified, this is an abstract site class
-                subclass.register_sites()
-                cls._SITES.update(subclass._SITES)
+    def __init_subclass__(cls, **kwargs):
+        """
+        Register all sites that subclass Site as they are defined.
+        """
+        super().__init_subclass__(**kwargs)
+        name = cls.__dict__.get("NAME")
+        if not name:
+            # If no NAME is specified, this is an abstract site class
+            return
+        if name in Site._SITES:
+            raise Site.AlreadyRegisteredException(name)
+        Site._SITES[name] = cls
 
     def __init__(self, server_class):
         self.server_class = server_class
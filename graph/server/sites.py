@@ -8,7 +8,7 @@ Copyright (c) 2022 Ben Croisdale. All rights reserved.
 Released under the Apache 2.0 license as described in the file LICENSE.
 """
 
-from exo_server import Site, DefaultSite
+from .exo_server import Site, DefaultSite
 
 
 class AdminSite(DefaultSite):
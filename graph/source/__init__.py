@@ -27,5 +27,3 @@ for modpath in (Path(__file__).parent).iterdir():
         globals().update({name: getattr(module, name) for name in names})
 
 sys.path = old_path
-
-SourceHandler.register_handlers()
@@ -10,12 +10,20 @@ Released under the Apache 2.0 license as described in the file LICENSE.
 
 import logging
 import datetime
+import functools
+import textwrap
 
 from storage import PersistentDict, CONTENT_ROOT
 
 from fs.memoryfs import MemoryFS
 
 
+@functools.lru_cache(maxsize=None)
+def _dedent_docs(docs):
+    """ Docstrings never change at runtime, so dedent each one only once """
+    return textwrap.dedent(docs or "").strip()
+
+
 class sh_meta(type):
     """ Python 3.8 doesn't have a nice way to have class properties :( """
 
@@ -46,6 +54,11 @@ class sh_meta(type):
             "last-imported": cls.records.get("last-imported", "NEVER"),
         }
 
+    @property
+    def display_docs(cls):
+        """ The class docstring, dedented for display """
+        return _dedent_docs(cls.__doc__)
+
     @property
     def content_dir(cls):
         return CONTENT_ROOT / cls.NAME
@@ -99,7 +112,7 @@ class SourceHandler(metaclass=sh_meta):
     _RECORDS = PersistentDict("source-records")
     """ This dictionary keeps records of when sources were pulled """
 
-    class SourceHandlerException:
+    class SourceHandlerException(Exception):
         pass
 
     class AlreadyRegisteredException(SourceHandlerException):
@@ -108,16 +121,15 @@ class SourceHandler(metaclass=sh_meta):
     class UnknownProcessedFormat(SourceHandlerException):
         pass
 
-    @classmethod
-    def register_handlers(cls):
+    def __init_subclass__(cls, **kwargs):
         """
-        When SourceHandlers is imported from outside, this is called _once_
-        to grab all subclasses and register them as source handlers.
+        Register every subclass as a source handler as soon as it is defined,
+        so lookups by name are a single dictionary access.
         """
-        if cls._SOURCES:
-            raise SourceHandler.AlreadyRegisteredException()
-        for subclass in cls.__subclasses__():
-            cls._SOURCES[subclass.NAME] = subclass
+        super().__init_subclass__(**kwargs)
+        if cls.NAME in SourceHandler._SOURCES:
+            raise SourceHandler.AlreadyRegisteredException(cls.NAME)
+        SourceHandler._SOURCES[cls.NAME] = cls
 
     def write_processed(self, processed, directory):
         """ Write the processed content to the directory """
@@ -11,6 +11,7 @@ Released under the Apache 2.0 license as described in the file LICENSE.
 """
 
 from pathlib import Path
+from stat import S_ISDIR
 from datetime import datetime
 from collections import namedtuple
 from functools import cached_property
@@ -31,19 +32,24 @@ class RichPath(type(Path())):
 
         WARNING: 'Created' time is platform dependent and may not be accurate on unix.
         """
-        if self.is_dir():
-            max_ctime = max(self.rglob("*"), key=lambda f: f.stat().st_ctime).stat().st_ctime
-            max_mtime = max(self.rglob("*"), key=lambda f: f.stat().st_mtime).stat().st_mtime
-            max_atime = max(self.rglob("*"), key=lambda f: f.stat().st_atime).stat().st_atime
         try:
             stat = self.stat()
-            return RichPath.Times(
-                created=datetime.fromtimestamp(max(stat.st_ctime, max_ctime)),
-                modified=datetime.fromtimestamp(max(stat.st_mtime, max_mtime)),
-                accessed=datetime.fromtimestamp(max(stat.st_atime, max_atime)),
-            )
         except FileNotFoundError:
             return RichPath.Times(created=None, modified=None, accessed=None)
+
+        # Stat each entry once and fold all three times in the same pass
+        ctime, mtime, atime = stat.st_ctime, stat.st_mtime, stat.st_atime
+        if S_ISDIR(stat.st_mode):
+            for child in self.rglob("*"):
+                cstat = child.stat()
+                ctime = max(ctime, cstat.st_ctime)
+                mtime = max(mtime, cstat.st_mtime)
+                atime = max(atime, cstat.st_atime)
+        return RichPath.Times(
+            created=datetime.fromtimestamp(ctime),
+            modified=datetime.fromtimestamp(mtime),
+            accessed=datetime.fromtimestamp(atime),
+        )
     
     @cached_property
     def size(self):
@@ -55,6 +61,8 @@ class RichPath(type(Path())):
 
 STORAGE_ROOT = RichPath("~/global_projects/.storage/ex").expanduser()
 """ TODO Extract this to a config """
+JINJA_CACHE = STORAGE_ROOT / "jinja-bytecode"
+AST_CACHE = STORAGE_ROOT / "ast-cache.pickle"
 
 EXOCORTEX_ROOT = RichPath(__file__).parent.parent.parent
 PROJECT_ROOT = EXOCORTEX_ROOT / "exocortex"
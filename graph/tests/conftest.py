@@ -0,0 +1,14 @@
+"""
+conftest.py
+Shared test setup; modules import from the graph/ root, as the CLI does.
+
+Author: Ben Croisdale
+
+Copyright (c) 2022 Ben Croisdale. All rights reserved.
+Released under the Apache 2.0 license as described in the file LICENSE.
+"""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
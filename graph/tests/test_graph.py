@@ -0,0 +1,57 @@
+"""
+test_graph.py
+Tests for the DocumentGraph caches.
+
+Author: Ben Croisdale
+
+Copyright (c) 2022 Ben Croisdale. All rights reserved.
+Released under the Apache 2.0 license as described in the file LICENSE.
+"""
+
+import pytest
+
+pytest.importorskip("graph_tool")
+pytest.importorskip("graphene")
+
+from graph_tool import Graph
+
+from process.graph import DocumentGraph
+
+
+@pytest.fixture
+def docgraph():
+    """ a -[in]-> b -[ref]-> c, built directly rather than parsed from content """
+    graph = Graph(directed=True)
+    graph.add_vertex(3)
+    names = graph.new_vertex_property("string", vals=["a", "b", "c"])
+    uuids = graph.new_vertex_property("string", vals=["ua", "ub", "uc"])
+    graph.vertex_properties["names"] = names
+    graph.vertex_properties["uuids"] = uuids
+    graph.add_edge_list([(0, 1), (1, 2)])
+    predicates = graph.new_edge_property("vector<string>")
+    predicates[graph.edge(0, 1)] = ["in"]
+    predicates[graph.edge(1, 2)] = ["ref"]
+    graph.edge_properties["predicates"] = predicates
+    return DocumentGraph(graph=graph)
+
+
+def test_edge_write_invalidates_predicates(docgraph):
+    assert docgraph.predicate_counts == {"in": 1, "ref": 1}
+    assert docgraph.pgraph_in.graph.num_edges() == 1
+
+    docgraph.edge_between("b", "c")["predicates"] = ["in", "tag"]
+
+    assert docgraph.predicate_counts == {"in": 2, "tag": 1}
+    assert sorted(docgraph.predicates) == ["in", "tag"]
+    assert docgraph.pgraph_in.graph.num_edges() == 2
+    assert docgraph.pgraph_ref.graph.num_edges() == 0
+
+
+def test_calculate_skips_cache_for_property_maps(docgraph):
+    weight = docgraph.graph.new_edge_property("double", val=1.0)
+    before = docgraph.calculate("pagerank", weight=weight)
+
+    weight[docgraph.graph.edge(0, 1)] = 0.0
+
+    after = docgraph.calculate("pagerank", weight=weight)
+    assert list(after.a) != list(before.a)
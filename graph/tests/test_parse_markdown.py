@@ -0,0 +1,27 @@
+"""
+test_parse_markdown.py
+Tests for loading and parsing content.
+
+Author: Ben Croisdale
+
+Copyright (c) 2022 Ben Croisdale. All rights reserved.
+Released under the Apache 2.0 license as described in the file LICENSE.
+"""
+
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("marko")
+
+from process import parse_markdown
+from process.parse_markdown import recursive_load, _parse_entries
+
+TEST_CONTENT = Path(__file__).resolve().parent.parent / "process" / "test-content"
+
+
+def test_parallel_parse_matches_serial(monkeypatch):
+    monkeypatch.setattr(parse_markdown, "_PARALLEL_PARSE_MIN", 1)
+    raws = list(recursive_load(TEST_CONTENT).values())
+
+    assert _parse_entries(raws, workers=2) == _parse_entries(raws)